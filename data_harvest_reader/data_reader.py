@@ -4,12 +4,78 @@ import polars as pl
 import os
 import zipfile
 import io
+import json
+import mmap
 import re
 import sys
+import operator
+import threading
+from contextlib import ExitStack
+from functools import partial, reduce
+from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor
 from loguru import logger
 
 
+_ZIP_BUFFER_SIZE = 1 << 20
+# The timestamp alternative comes first, otherwise _(\d+) would only strip its year
+_KEY_RE = re.compile(r'_(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})|_(\d+)')
+_TIMESTAMP_RE = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}')
+# Polars errors raised by a filter that does not fit the schema of the file it is applied to
+_FILTER_ERRORS = (pl.exceptions.ColumnNotFoundError, pl.exceptions.ComputeError, pl.exceptions.InvalidOperationError)
+
+
+# Each filter operation builds a polars expression from a column expression and the rule values
+_FILTER_OPERATIONS = {
+    '==': lambda col, values: col == values,
+    '!=': lambda col, values: col != values,
+    '>': lambda col, values: col > values,
+    '>=': lambda col, values: col >= values,
+    '<': lambda col, values: col < values,
+    '<=': lambda col, values: col <= values,
+    'in': lambda col, values: col.is_in(values if isinstance(values, list) else [values]),
+    'notin': lambda col, values: ~col.is_in(values if isinstance(values, list) else [values]),
+}
+
+
+def _has_numbered_part(name):
+    """
+    The _has_numbered_part function tells whether any '_' in the name is followed by a digit,
+    which is exactly when _KEY_RE has something to strip.
+
+    :param name: Specify the file name without its extension
+    :return: True if the name contains a '_<digit>' sequence
+    """
+    return any(part[:1].isdecimal() for part in name.split('_')[1:])
+
+
+def _strip_suffix(base_name):
+    """
+    The _strip_suffix function removes the numeric and timestamp suffixes that tell similar files apart,
+    e.g. sales_1 and sales_2024-01-31 10:00:00 both become sales.
+    A single trailing suffix is handled with str.rpartition, the regex only runs for names with several.
+
+    :param base_name: Specify the file name without its extension
+    :return: The name shared by all the similar files
+    """
+    head, sep, tail = base_name.rpartition('_')
+    if sep and (tail.isdecimal() or _TIMESTAMP_RE.fullmatch(tail)) and not _has_numbered_part(head):
+        return head
+    if not _has_numbered_part(base_name):
+        return base_name
+    return _KEY_RE.sub('', base_name)
+
+
+class _MappedFile(mmap.mmap):
+    """
+    A read-only memory map that zipfile accepts as an archive file object.
+    zipfile checks seekable() on the file it is given, which mmap only provides from Python 3.13.
+    """
+
+    def seekable(self):
+        return True
+
+
 class UnsupportedFormatError(Exception):
     pass
 
@@ -20,59 +86,120 @@ class FilterConfigurationError(Exception):
 
 def _read_csv(file_path, chunksize=None, **kwargs):
     """
-    The _read_csv function reads a csv file and returns the data as a pandas DataFrame.
+    The _read_csv function lazily scans a csv file and returns the query plan as a polars LazyFrame.
+    Nothing is parsed until the plan is collected, so filters and projections are pushed into the scan.
 
-    :param self: Represent the instance of the class
     :param file_path: Specify the path to the file that we want to read
-    :param chunksize: Specify the size of each chunk
+    :param chunksize: Deprecated and ignored, polars' scan_csv sizes its batches itself
     :param **kwargs: Pass in any additional parameters that may be required by the function
-    :return: A pandas dataframe
-    :doc-author: Trelent
+    :return: A polars LazyFrame
     """
-    if chunksize:
-        return pl.scan_csv(file_path, batch_size=chunksize, **kwargs).collect()
-    else:
-        return pl.read_csv(file_path, **kwargs)
+    if chunksize is not None:
+        logger.warning("chunksize is deprecated and ignored, csv files are scanned lazily")
+    return pl.scan_csv(file_path, **kwargs)
 
 
 def _read_json(file_path, **kwargs):
     """
-    The _read_json function reads a JSON file and returns the data as a Pandas DataFrame.
+    The _read_json function reads a JSON file and returns the data as a polars LazyFrame.
+    Files holding one JSON object per line are scanned lazily as NDJSON, other documents are read eagerly.
+
+    :param file_path: Specify the location of the file to be read, or a buffered zip member
+    :param **kwargs: Pass a variable number of keyword arguments to a function
+    :return: A polars LazyFrame
+    """
+    if not isinstance(file_path, str):
+        # Zip members are read into memory once, both polars readers would load them whole anyway
+        file_path = file_path.read()
+    if _is_ndjson(file_path):
+        return _read_ndjson(file_path, **kwargs)
+    return pl.read_json(file_path, **kwargs).lazy()
+
+
+def _read_ndjson(file_path, **kwargs):
+    """
+    The _read_ndjson function lazily scans a newline delimited JSON file into a polars LazyFrame.
 
-    :param self: Represent the instance of the class
     :param file_path: Specify the location of the file to be read
     :param **kwargs: Pass a variable number of keyword arguments to a function
-    :return: A pandas dataframe
-    :doc-author: Trelent
+    :return: A polars LazyFrame
     """
-    return pl.read_json(file_path, **kwargs)
+    return pl.scan_ndjson(file_path, **kwargs)
+
 
+def _is_ndjson(file_path):
+    """
+    The _is_ndjson function sniffs the start of a JSON file to tell NDJSON records from a single JSON document.
+    A first non-blank line that is a complete JSON object means one record per line.
+    Only that line is read, a document starting with '[' is recognized from its first character.
 
-def _read_parquet(file_path, n_rows=None, low_memory=False, **kwargs):
+    :param file_path: Specify the path of the file, or the bytes of a zip member
+    :return: True if the file holds one JSON object per line
     """
-    The _read_parquet function reads a Parquet file into a Pandas DataFrame.
+    if isinstance(file_path, bytes):
+        return _starts_with_json_object_line(io.BytesIO(file_path))
+    with open(file_path, 'rb') as fh:
+        return _starts_with_json_object_line(fh)
+
+
+def _starts_with_json_object_line(fh):
+    """
+    The _starts_with_json_object_line function skips leading whitespace and checks whether the first line holds a
+    complete JSON object.
+
+    :param fh: Pass a binary file object positioned at the start of the document
+    :return: True if the first non-blank line parses as a JSON object
+    """
+    char = fh.read(1)
+    while char and char.isspace():
+        char = fh.read(1)
+    if char != b'{':
+        return False
+    try:
+        return isinstance(json.loads(char + fh.readline()), dict)
+    except ValueError:
+        return False
+
+
+def _read_parquet(file_path, n_rows=None, low_memory=False, parallel='auto', use_statistics=True, **kwargs):
+    """
+    The _read_parquet function lazily scans a Parquet file into a polars LazyFrame.
     :param file_path: Specify the path to the file that is being read
     :param n_rows: Limit the number of rows read from a file
     :param low_memory: Determine whether to use a buffer when reading the data
+    :param parallel: Choose how the scan is parallelized: 'auto', 'columns', 'row_groups' or 'none'.
+                     'auto' already picks 'row_groups' when a file has more row groups than threads
+    :param use_statistics: Use the row group statistics to skip row groups that cannot match a filter
     :param **kwargs: Pass keyworded, variable-length argument list to a function
-    :return: A dataframe
+    :return: A polars LazyFrame
     """
-    try:
-        lazy_df = pl.scan_parquet(file_path, n_rows=n_rows, low_memory=low_memory, **kwargs)
-        return lazy_df.collect()  # Collect the data into a DataFrame
-    except Exception as e:
-        logger.error(f"Error reading Parquet file {file_path}: {e}")
-        raise
+    return pl.scan_parquet(file_path, n_rows=n_rows, low_memory=low_memory,
+                           parallel=parallel, use_statistics=use_statistics, **kwargs)
 
 
 def _read_excel(file_path, **kwargs):
     """
-    The _read_excel function reads in an excel file and returns a pandas dataframe.
-    :param file_path: Specify the path of the file to be read
+    The _read_excel function reads in an excel file and returns it as a polars LazyFrame.
+    :param file_path: Specify the path of the file to be read, or a buffered zip member
     :param **kwargs: Pass a variable number of keyword arguments to the function
-    :return: A pandas dataframe
+    :return: A polars LazyFrame
     """
-    return pl.read_excel(file_path, **kwargs)
+    if not isinstance(file_path, str):
+        # Zip members are handed over as bytes: polars' calamine engine rejects the member's text-mode handle
+        # and would resolve its name against the working directory instead of the archive
+        file_path = file_path.read()
+    return pl.read_excel(file_path, **kwargs).lazy()
+
+
+# Supported file suffixes and their readers, matched with str.endswith
+_DISPATCH = (
+    ('.parquet', _read_parquet),
+    ('.csv', _read_csv),
+    ('.json', _read_json),
+    ('.ndjson', _read_ndjson),
+    ('.jsonl', _read_ndjson),
+    ('.xlsx', _read_excel),
+)
 
 
 class DataReader:
@@ -83,21 +210,13 @@ class DataReader:
         :param log_file: Specify the name of the log file
         :return: Nothing, but it does set up the logger
         """
-        self.data_formats = {
-                '.csv': _read_csv,
-                '.json': _read_json,
-                '.parquet': _read_parquet,
-                '.xlsx': _read_excel
-            }
-        self.__available_operations = ('notin', 'in', '==', '>',
-                                       '>=', '<', '<=', '!=')
         logger.remove()  # Remove default handlers
         logger.add(
             sys.stderr,  # Log to stderr (console)
             format="{time:YYYY-MM-DD at HH:mm:ss} | {level} | {message}",
             level="INFO",
             colorize=True,
-            enqueue=True,  # Enable thread-safe logging
+            enqueue=False,  # Sink writes are already locked, skip the queue on the per-file hot path
             backtrace=True,  # Enable extended traceback logging
             diagnose=True  # Enable diagnosis information
         )
@@ -118,27 +237,64 @@ class DataReader:
                   join_similar=False,
                   duplicated_subset_dict: dict = None,
                   filter_subset: dict = None,
+                  projection: dict = None,
+                  streaming=False,
                   **kwargs):
         """
-        The read_data function reads data from a directory or ZIP file and returns a dictionary of pandas DataFrames.
+        The read_data function reads data from a directory or ZIP file and returns a dictionary of polars DataFrames.
         :param source: Specify the path to a directory or zip file
         :param join_similar: Join the dataframes that have similar columns
         :param duplicated_subset_dict: dict: Remove duplicates from the dataframe
-        :param filter_subset: dict: Apply custom filters to the dataframes
+        :param filter_subset: dict: Apply custom filters to the dataframes, before deduplication.
+                              A row is kept when all 'and' rules hold, or when any 'or' rule holds
+        :param projection: dict: Select only these columns of the dataframes, they are the only ones read from disk
+        :param streaming: Execute the plans with the streaming engine, for files larger than memory.
+                          Opt-in, since the default engine is faster for data that fits in memory
         :param **kwargs: Pass keyword arguments to the function
         :return: A dictionary of dataframes
         """
         logger.info("Starting data reading process")
 
-        # Check if the source is a string path to a directory
-        if isinstance(source, str) and os.path.isdir(source):
-            logger.info("Reading data from directory: {}", source)
-            data = self._read_from_directory(source, join_similar, **kwargs)
+        # Filters are compiled once per dataframe key and attached to each file's scan,
+        # so polars can push them into the reader
+        file_filters = {}
+        if filter_subset:
+            logger.info("Applying custom filters")
+            for k, v in filter_subset.items():
+                key = f'df_{k}'
+                query = self._build_filter_query(v, key) if v else None
+                if query is not None:
+                    file_filters[key] = query
+
+        # Projected columns are selected on each file's scan, so only they are read from disk
+        file_columns = {}
+        if projection:
+            for k, columns in projection.items():
+                # Deduplication runs after the projection and still needs its subset columns
+                subset = (duplicated_subset_dict or {}).get(k) or []
+                file_columns[f'df_{k}'] = list(dict.fromkeys([*columns, *subset]))
+
+        # Deduplication subsets are checked against each file's schema before the plans are collected
+        file_subsets = {}
+        if duplicated_subset_dict:
+            file_subsets = {f'df_{k}': v for k, v in duplicated_subset_dict.items() if v}
 
-        # Check if the source is a string path to a ZIP file or ZIP file bytes
-        elif isinstance(source, (str, bytes)) and (os.path.isfile(source) or isinstance(source, bytes)):
+        # ZIP file bytes are checked first, they must never reach os.path.isfile
+        if isinstance(source, bytes):
             logger.info("Reading data from zip source")
-            data = self._read_from_zip(source, join_similar, **kwargs)
+            plans = self._read_from_zip(source, join_similar, file_filters, file_columns, file_subsets, **kwargs)
+
+        # Check if the source is a string path to a directory or a ZIP file
+        elif isinstance(source, str):
+            if os.path.isdir(source):
+                logger.info("Reading data from directory: {}", source)
+                plans = self._read_from_directory(source, join_similar, file_filters, file_columns, file_subsets, **kwargs)
+            elif os.path.isfile(source):
+                logger.info("Reading data from zip source")
+                plans = self._read_from_zip(source, join_similar, file_filters, file_columns, file_subsets, **kwargs)
+            else:
+                logger.error("Source path does not exist: {}", source)
+                raise ValueError("Unsupported source type")
 
         # Raise an error if the source is neither a directory nor a ZIP file
         else:
@@ -147,27 +303,31 @@ class DataReader:
 
         if duplicated_subset_dict:
             logger.info("Applying deduplication process")
-            try:
-                data = {
-                    f'df_{k}': data[f'df_{k}'].unique(subset=v if v else None, keep='first')
-                    if f"df_{k}" in data else data[f'df_{k}']
-                    for k, v in duplicated_subset_dict.items()
-                }
-            except Exception as e:
-                logger.exception("An error occurred during deduplication")
-                raise e
-
-        if filter_subset:
-            logger.info("Applying custom filters")
-            try:
-                data = {
-                    f'df_{k}': self.apply_filters(data[f'df_{k}'], v, f'df_{k}')
-                    if f"df_{k}" in data else data[f'df_{k}']
-                    for k, v in filter_subset.items()
-                }
-            except Exception as e:
-                logger.exception("An error occurred during filtering")
-                raise e
+            for k, v in duplicated_subset_dict.items():
+                key = f'df_{k}'
+                plan = plans.get(key)
+                if plan is not None:
+                    plans[key] = plan.unique(subset=v or None, keep='first')
+
+        if projection:
+            # Drop the subset columns that were only read for the deduplication
+            for k, columns in projection.items():
+                key = f'df_{k}'
+                plan = plans.get(key)
+                if plan is not None:
+                    plans[key] = plan.select(columns)
+
+        # Filters and deduplication were only appended to the lazy plans, run them all in one pass on the polars
+        # thread pool, letting common subplan/subexpression elimination share the work between the plans.
+        # The configuration was checked per file, errors raised here come from reading the files themselves.
+        engine = 'streaming' if streaming else 'auto'
+        optimizations = pl.QueryOptFlags(comm_subplan_elim=True, comm_subexpr_elim=True)
+        try:
+            frames = pl.collect_all(plans.values(), engine=engine, optimizations=optimizations)
+        except Exception:
+            logger.exception("An error occurred while reading the data")
+            raise
+        data = dict(zip(plans.keys(), frames))
 
         logger.success("Data reading process completed")
         return data
@@ -177,27 +337,45 @@ class DataReader:
         """
         The apply_filters function takes a dataframe, a list of filters and the name of the dataframe as input.
         It then applies each filter to the dataframe and returns it.
+        The filters are built as polars expressions, so a LazyFrame keeps them in its plan for predicate pushdown.
+        Rules are grouped by their 'operator' rather than folded in order: a row is kept when all 'and' rules
+        hold, or when any 'or' rule holds. For example [A and, B or, C and] means (A & C) | B.
         The function raises an exception if there is an error in applying any filter.
         :param df: Get the dataframe to apply the filters on
         :param filters: Pass in the filter rules to apply
         :param df_name: Identify the dataframe that is being filtered
         :return: A dataframe with the filters applied
         """
+        if not filters:
+            return df
+
+        query = self._build_filter_query(filters, df_name)
+        if query is None:
+            return df
+
+        try:
+            return df.filter(query)
+        except Exception as e:
+            logger.error("Error applying filters to {}: {}", df_name, e)
+            raise FilterConfigurationError(f"Error in filter configuration for {df_name}: {e}")
+
+    def _build_filter_query(self, filters, df_name):
+        """
+        The _build_filter_query function combines a list of filter rules into a single polars expression.
+        The expression can be built once and reused on every file that belongs to the same dataframe.
+        :param filters: Pass in the filter rules to combine
+        :param df_name: Identify the dataframe that is being filtered
+        :return: A boolean polars expression, or None if no rule builds a condition
+        """
         try:
-            query = pl.lit(True)
+            and_conditions = []
+            or_conditions = []
 
             for filter_rule in filters:
                 col = filter_rule['column']
                 operation = filter_rule['operation']
                 values = filter_rule['values']
-                operator = filter_rule.get('operator', 'and')
-
-                # Validate operation
-                if operation not in self.__available_operations:
-                    msg = (f"{operation} is not allowed, the only allowed operations are "
-                           f"'{', '.join(map(str, self.__available_operations))}'")
-                    logger.exception(msg)
-                    raise FilterConfigurationError(msg)
+                logical_operator = filter_rule.get('operator', 'and')
 
                 # Validate values for certain operations
                 if operation not in ('notin', 'in') and isinstance(values, list):
@@ -207,55 +385,48 @@ class DataReader:
                     raise FilterConfigurationError(msg)
 
                 # Build filter condition based on the operation
-                condition = self._build_filter_condition(df, col, operation, values)
+                condition = self._build_filter_condition(col, operation, values)
 
-                # Combine conditions based on the specified logical operator
-                if operator == 'and':
-                    query = query & condition
-                elif operator == 'or':
-                    query = query | condition
+                # Group conditions based on the specified logical operator
+                if logical_operator == 'and':
+                    and_conditions.append(condition)
+                elif logical_operator == 'or':
+                    or_conditions.append(condition)
 
-            return df.filter(query)
+            # All 'and' conditions must hold, or at least one of the 'or' conditions
+            query = reduce(operator.and_, and_conditions) if and_conditions else None
+            if or_conditions:
+                or_query = reduce(operator.or_, or_conditions)
+                query = or_query if query is None else query | or_query
+
+            return query
         except Exception as e:
-            logger.error(f"Error applying filters to {df_name}: {e}")
+            logger.error("Error building filters for {}: {}", df_name, e)
             raise FilterConfigurationError(f"Error in filter configuration for {df_name}: {e}")
 
 
-    def _build_filter_condition(self, df, column, operation, values):
+    def _build_filter_condition(self, column, operation, values):
         """
-        The _build_filter_condition function takes in a dataframe, column name, operation and values.
-        It then builds a condition based on the operation and values provided.
+        The _build_filter_condition function takes in a column name, operation and values.
+        It then looks the operation up in _FILTER_OPERATIONS and builds the condition on pl.col(column).
         The function returns the condition.
-        :param df: Specify the dataframe that we want to filter
         :param column: Specify the column name that we want to filter on
         :param operation: Determine which condition to use
         :param values: Create a condition based on the operation
-        :return: A boolean series
+        :return: A boolean polars expression
         """
-        if operation == '==':
-            condition = df[column] == values
-        elif operation == '>':
-            condition = df[column] > values
-        elif operation == '>=':
-            condition = df[column] >= values
-        elif operation == '<':
-            condition = df[column] < values
-        elif operation == '<=':
-            condition = df[column] <= values
-        elif operation == '!=':
-            condition = df[column] != values
-        elif operation == 'in':
-            values = values if isinstance(values, list) else [values]
-            condition = df[column].is_in(values)
-        elif operation == 'notin':
-            values = values if isinstance(values, list) else [values]
-            condition = ~df[column].is_in(values)
-        else:
-            raise FilterConfigurationError(f"Unsupported operation: {operation}")
+        try:
+            build_condition = _FILTER_OPERATIONS[operation]
+        except KeyError:
+            msg = (f"{operation} is not allowed, the only allowed operations are "
+                   f"'{', '.join(_FILTER_OPERATIONS)}'")
+            logger.error(msg)
+            raise FilterConfigurationError(msg) from None
 
-        return condition
+        return build_condition(pl.col(column), values)
 
-    def _read_from_directory(self, directory_path, join_similar, **kwargs):
+    def _read_from_directory(self, directory_path, join_similar, file_filters=None, file_columns=None,
+                             file_subsets=None, **kwargs):
         """
         The _read_from_directory function is a helper function that reads all the files in a directory and returns
         a list of dataframes. The function takes as input:
@@ -265,14 +436,20 @@ class DataReader:
                             large dataframe at some point later on in our code.
         :param directory_path: Specify the path to a directory containing files that will be read
         :param join_similar: Join the similar sentences
+        :param file_filters: Map a dataframe key to the filter expression applied to each of its files
+        :param file_columns: Map a dataframe key to the columns selected from each of its files
+        :param file_subsets: Map a dataframe key to the deduplication subset its files must contain
         :param **kwargs: Pass a variable number of keyword arguments to a function
         :return: The _read_files_parallel function
         """
         files = [os.path.join(directory_path, f) for f in os.listdir(directory_path) if
                  os.path.isfile(os.path.join(directory_path, f))]
-        return self._read_files_parallel(files, join_similar, **kwargs)
+        # Independent files on disk, one thread per core
+        return self._read_files_parallel(files, join_similar, file_filters, file_columns, file_subsets,
+                                         max_workers=os.cpu_count(), **kwargs)
 
-    def _read_from_zip(self, zip_source, join_similar, **kwargs):
+    def _read_from_zip(self, zip_source, join_similar, file_filters=None, file_columns=None, file_subsets=None,
+                       **kwargs):
         """
         The _read_from_zip function is a helper function that reads in the zip file and returns
         the dataframe. It takes in the following parameters:
@@ -282,77 +459,154 @@ class DataReader:
                             (e.g., &quot;Name&quot; and &quot;NAME&quot; will become just &quot;Name&quot;). If False, then no joining occurs.
         :param zip_source: Specify the source of the zip file
         :param join_similar: Join similar files in the zip file
+        :param file_filters: Map a dataframe key to the filter expression applied to each of its files
+        :param file_columns: Map a dataframe key to the columns selected from each of its files
+        :param file_subsets: Map a dataframe key to the deduplication subset its files must contain
         :param **kwargs: Pass a variable number of keyword arguments to a function
         :return: A list of files
         """
-        if isinstance(zip_source, str):
-            with zipfile.ZipFile(zip_source, 'r') as zip_ref:
-                file_names = zip_ref.namelist()
-                files = [zip_ref.open(name) for name in file_names]
-        elif isinstance(zip_source, bytes):
-            zip_ref = zipfile.ZipFile(io.BytesIO(zip_source), 'r')
-            file_names = zip_ref.namelist()
-            files = [zip_ref.open(name) for name in file_names]
-        else:
-            raise ValueError("Invalid zip source type")
-
-        return self._read_files_parallel(files, join_similar, **kwargs)
-
-    def _read_files_parallel(self, files, join_similar, **kwargs):
+        with ExitStack() as stack:
+            if isinstance(zip_source, str):
+                # Map the archive instead of reading it through a buffered file handle
+                with open(zip_source, 'rb') as fh:
+                    # mmap refuses empty files, report them as zipfile would
+                    if os.fstat(fh.fileno()).st_size == 0:
+                        raise zipfile.BadZipFile("File is not a zip file")
+                    mapped = stack.enter_context(_MappedFile(fh.fileno(), 0, access=mmap.ACCESS_READ))
+                zip_ref = stack.enter_context(zipfile.ZipFile(mapped, 'r'))
+            elif isinstance(zip_source, bytes):
+                zip_ref = stack.enter_context(zipfile.ZipFile(io.BytesIO(zip_source), 'r'))
+            else:
+                raise ValueError("Invalid zip source type")
+
+            # Members are opened one at a time by the workers, the archive stays open until all are read.
+            # The parsed ZipInfo entries are handed over so open() needs no name lookup. The lock guards
+            # ZipFile.open on this archive, reads from opened members are synchronized by zipfile itself.
+            open_lock = threading.Lock()
+            files = [(zip_ref, info, open_lock) for info in zip_ref.infolist() if not info.is_dir()]
+            # All members share one archive and its lock, more than half the cores only adds contention
+            return self._read_files_parallel(files, join_similar, file_filters, file_columns, file_subsets,
+                                             max_workers=max(2, (os.cpu_count() or 4) // 2), **kwargs)
+
+    def _read_files_parallel(self, files, join_similar, file_filters=None, file_columns=None, file_subsets=None,
+                             max_workers=None, **kwargs):
         """
         The _read_files_parallel function is a helper function that reads all the files in parallel.
         It uses ThreadPoolExecutor to create a pool of threads and map them to the _read_file function.
-        The results are then stored in a dictionary with keys being df_{base_name} where base_name is
-        the name of the file without any extensions or numbers at the end.
+        Csv and parquet files are only scanned here, their decoding happens later in pl.collect_all.
+        The results are then stored in a dictionary under the df_{base_name} keys computed by _read_file.
+        Filters are attached to every file before the similar files are joined, so each scan can skip rows itself.
 
         :param files: Pass the list of files to be read
         :param join_similar: Join similar files into one dataframe
+        :param file_filters: Map a dataframe key to the filter expression applied to each of its files
+        :param file_columns: Map a dataframe key to the columns selected from each of its files
+        :param file_subsets: Map a dataframe key to the deduplication subset its files must contain
+        :param max_workers: Set the number of reader threads, ThreadPoolExecutor's default when None
         :param **kwargs: Pass keyworded, variable-length argument list to a function
-        :return: A dictionary of dataframes
+        :return: A dictionary of lazy frames
         """
-        with ThreadPoolExecutor() as executor:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
             # Pass kwargs to the file reading function
-            results = executor.map(lambda f: self._read_file(f, join_similar, **kwargs), files)
+            results = executor.map(partial(self._read_file, join_similar=join_similar, **kwargs), files)
 
-        dataframes = {}
-        for file_name, df in results:
+        file_filters = file_filters or {}
+        file_columns = file_columns or {}
+        file_subsets = file_subsets or {}
+        groups = defaultdict(list)
+        for key, df in results:
             if df is not None:
-                logger.info(f"File reading for {file_name} finished")
-                base_name = os.path.splitext(os.path.basename(file_name))[0]
-                base_name = re.sub(r'_(\d+)|_(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})|_(\d{14})', '',
-                                   base_name) if join_similar else base_name
-                key = f'df_{base_name}'
-                if key in dataframes and join_similar:
-                    dataframes[key] = pl.concat([dataframes[key], df])
+                query = file_filters.get(key)
+                subset = file_subsets.get(key)
+                columns = file_columns.get(key)
+                if query is not None or subset or columns:
+                    self._check_file_configuration(df, key, query, subset, columns)
+                if query is not None:
+                    df = df.filter(query)
+                if columns:
+                    df = df.select(columns)
+                if join_similar:
+                    groups[key].append(df)
                 else:
-                    dataframes[key] = df
+                    groups[key] = [df]
+
+        # Similar files are concatenated once per key instead of growing the frame file by file
+        return {key: pl.concat(group, how='vertical_relaxed') if len(group) > 1 else group[0]
+                for key, group in groups.items()}
 
-        return dataframes
+    def _check_file_configuration(self, df, key, query=None, subset=None, columns=None):
+        """
+        The _check_file_configuration function checks the filter, deduplication subset and projection of a dataframe
+        against the schema of one of its files, before they are attached to the file's scan.
+        Only the schema is resolved and the filter runs on an empty frame, so no data is read, and errors that
+        pl.collect_all raises later come from the data itself rather than from the configuration.
+        :param df: Pass the lazy frame of the file
+        :param key: Identify the dataframe the file belongs to
+        :param query: Pass the filter expression of the dataframe
+        :param subset: Pass the deduplication subset of the dataframe
+        :param columns: Pass the projected columns of the dataframe
+        :return: Nothing, a FilterConfigurationError is raised if the filter or the subset does not fit the file,
+                 a ColumnNotFoundError if the projection does not
+        """
+        schema = df.collect_schema()
+
+        if query is not None:
+            try:
+                pl.LazyFrame(schema=schema).filter(query).collect()
+            except _FILTER_ERRORS as e:
+                logger.error("Error applying filters to {}: {}", key, e)
+                raise FilterConfigurationError(f"Error in filter configuration for {key}: {e}") from e
+
+        missing = [column for column in subset or [] if column not in schema]
+        if missing:
+            msg = f"Deduplication subset for {key} refers to missing columns: {', '.join(missing)}"
+            logger.error(msg)
+            raise FilterConfigurationError(msg)
+
+        missing = [column for column in columns or [] if column not in schema]
+        if missing:
+            msg = f"Projection for {key} refers to missing columns: {', '.join(missing)}"
+            logger.error(msg)
+            raise pl.exceptions.ColumnNotFoundError(msg)
 
     def _read_file(self, file, join_similar, **kwargs):
         """
         The _read_file function is a helper function that reads in the data from a file.
         It takes as input:
-            - A file object (either an open zipfile or an open text/csv/parquet file)
+            - A file path, or a (zip_ref, zip_info, open_lock) tuple for a file inside an open zip archive
             - A boolean indicating whether to join similar columns together (e.g., if there are two columns called 'x' and 'y',
                 then they will be joined into one column called 'xy')
 
         :param file: Pass the file name to the function
         :param join_similar: Join similar columns in the dataframe
         :param **kwargs: Pass a dictionary of arguments to the function
-        :return: A tuple of the file name and a dataframe
+        :return: A tuple of the dataframe key and a dataframe
         """
-        file_name = file.name if isinstance(file, zipfile.ZipExtFile) else file
+        zip_ref, zip_info, open_lock = file if isinstance(file, tuple) else (None, None, None)
+        file_name = file if zip_ref is None else zip_info.filename
         try:
-            ext = os.path.splitext(file_name)[1]
-            read_func = self.data_formats.get(ext)
-
-            if not read_func:
-                raise UnsupportedFormatError(f"Unsupported file format: {ext}")
-
-            logger.info(f"Initiating reading of {file_name}")
-            return file_name, read_func(file, **kwargs)
+            for suffix, read_func in _DISPATCH:
+                if file_name.endswith(suffix):
+                    break
+            else:
+                raise UnsupportedFormatError(f"Unsupported file format: {os.path.splitext(file_name)[1]}")
+
+            # The key is derived here, on the worker thread, rather than after all files are read
+            base_name = os.path.basename(file_name)[:-len(suffix)]
+            base_name = _strip_suffix(base_name) if join_similar else base_name
+            key = f'df_{base_name}'
+
+            logger.info("Initiating reading of {}", file_name)
+            if zip_ref is None:
+                df = read_func(file_name, **kwargs)
+            else:
+                with open_lock:
+                    raw = zip_ref.open(zip_info)
+                with raw, io.BufferedReader(raw, buffer_size=_ZIP_BUFFER_SIZE) as buffer:
+                    df = read_func(buffer, **kwargs)
+            logger.info("File reading for {} finished", file_name)
+            return key, df
         except Exception as e:
-            logger.error(f"Error reading file {file_name}: {e}")
+            logger.error("Error reading file {}: {}", file_name, e)
             raise  # Re-raise other exceptions
 
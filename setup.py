@@ -20,7 +20,7 @@ setup(
     long_description_content_type="text/markdown",
     long_description=LONG_DESCRIPTION,
     packages=find_packages(),
-    install_requires=['polars', 'loguru', 'colorama'],
+    install_requires=['polars>=1.30', 'loguru', 'colorama'],
     keywords=['Python', 'File Reading', 'Multiple File Handler',],
     classifiers=[
         "Development Status :: 1 - Planning",